@@ -2,100 +2,153 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
-import json
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import threading
+import msgspec
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
 
-# --- NEW IMPORTS FOR CLOUDINARY ---
-import cloudinary
-import cloudinary.uploader
+from mailer import deliver_email, email_configured, is_permanent_email_error, RECEIVER_EMAIL
+from storage import init_db, save_submission
 
 # Load environment variables from .env file (for local testing)
 # On Render, these will be set directly in Render's dashboard.
 load_dotenv()
 
+# Largest request body accepted, including the image (10 MB)
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
 app = Flask(__name__)
+# Flask rejects larger bodies with 413 (see request_too_large) before reading them into memory
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
 # Enable CORS for all origins. For production, consider restricting to your frontend domain.
 CORS(app)
 
-# --- Email Configuration (using Resend via SMTP) ---
-SENDER_EMAIL = os.getenv('SENDER_EMAIL')
-SENDER_PASSWORD = os.getenv('SENDER_PASSWORD') # This is your Resend API Key
-RECEIVER_EMAIL = os.getenv('RECEIVER_EMAIL')
-# Set default SMTP_SERVER to Resend's server for robustness
-SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.resend.com')
-SMTP_PORT = int(os.getenv('SMTP_PORT', 587)) # Standard TLS port
+# Create the submissions database on startup
+init_db()
+
+# --- Background Email Delivery (SMTP settings live in mailer.py) ---
+EMAIL_MAX_RETRIES = 5 # Extra attempts for a queued email before giving up
+EMAIL_RETRY_DELAY = 30 # Seconds to wait between attempts
 
 # --- Cloudinary Configuration ---
-cloudinary.config(
-    cloud_name = os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key = os.getenv('CLOUDINARY_API_KEY'),
-    api_secret = os.getenv('CLOUDINARY_API_SECRET')
+CLOUDINARY_CLOUD_NAME = os.getenv('CLOUDINARY_CLOUD_NAME')
+CLOUDINARY_API_KEY = os.getenv('CLOUDINARY_API_KEY')
+CLOUDINARY_API_SECRET = os.getenv('CLOUDINARY_API_SECRET')
+CLOUDINARY_CHUNK_SIZE = 6_000_000 # Bytes per upload chunk (Cloudinary requires at least 5 MB)
+CLOUDINARY_POOL_SIZE = 10 # Keep-alive HTTPS connections to Cloudinary kept per worker
+
+# Template for the immediate notification email, filled from the submission record
+NOTIFICATION_BODY_FMT = (
+    "A new pest report has been submitted:\n\n"
+    "Name: {yourName}\n"
+    "Business Area: {businessArea}\n"
+    "Pest(s): {pests_joined}\n"
+    "{other_line}"
+    "Date: {reportDate}\n"
+    "Notes: {additionalNotes}\n"
+    "Image URL: {image_url}\n"
+    "Submitted At: {timestamp}"
 )
 
-# Path to store submission data
-SUBMISSIONS_FILE = 'data/submissions.json'
-
-# Ensure the 'data' directory exists
-os.makedirs('data', exist_ok=True)
-
-def send_email(subject, body, to_email):
+class PestReport(msgspec.Struct):
+    """The 'jsonData' form field sent by the frontend, with defaults for missing or null fields."""
+    yourName: str | None = None
+    businessArea: str | None = None
+    pests: list[str] | None = None
+    otherPest: str | None = None
+    reportDate: str | None = None
+    additionalNotes: str | None = None
+
+    def __post_init__(self):
+        # The frontend may send null for fields left empty; treat them like missing ones
+        if self.yourName is None:
+            self.yourName = 'N/A'
+        if self.businessArea is None:
+            self.businessArea = 'N/A'
+        if self.pests is None:
+            self.pests = []
+        if self.otherPest is None:
+            self.otherPest = '' # Keep as empty string if not provided
+        if self.reportDate is None:
+            self.reportDate = 'N/A'
+        if self.additionalNotes is None:
+            self.additionalNotes = 'N/A'
+
+_cloudinary_configured = False
+
+def get_cloudinary_uploader():
     """
-    Sends an email using SMTP.
-    This function connects to an email server and sends a message.
-    Configured for Resend (using SENDER_EMAIL as username and API Key as password).
+    Imports and configures the Cloudinary SDK on first use, including a shared connection pool.
+    Deferred so cold starts and routes without an image don't pay for loading it.
     """
-    if not SENDER_EMAIL or not SENDER_PASSWORD:
-        print("Email sender credentials not set. Cannot send email.")
-        return False
+    global _cloudinary_configured
+    import cloudinary
+    import cloudinary.uploader
+    if not _cloudinary_configured:
+        cloudinary.config(
+            cloud_name = CLOUDINARY_CLOUD_NAME,
+            api_key = CLOUDINARY_API_KEY,
+            api_secret = CLOUDINARY_API_SECRET
+        )
+        # The SDK sends uploads through a module-level urllib3 pool that keeps only one
+        # idle connection per host, so concurrent uploads keep redoing the TLS handshake.
+        # Rebuild it with the SDK's own connector (keeping its TCP keep-alive and proxy
+        # handling) but with room for more connections and retries on connection errors.
+        import urllib3
+        import cloudinary.utils
+        cloudinary.uploader._http = cloudinary.utils.get_http_connector(
+            cloudinary.config(),
+            {
+                **cloudinary.CERT_KWARGS,
+                'maxsize': CLOUDINARY_POOL_SIZE,
+                'retries': urllib3.Retry(total=3, backoff_factor=0.2)
+            }
+        )
+        _cloudinary_configured = True
+    return cloudinary.uploader
+
+# Emails are sent in the background so the HTTP response doesn't wait on the SMTP server
+_email_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='email')
+
+def _retry_email(subject, body, to_email, attempt):
+    """Puts a failed email back on the executor; called from a retry timer."""
+    try:
+        _email_executor.submit(send_email_task, subject, body, to_email, attempt)
+    except RuntimeError:
+        # The executor has been shut down because the worker is exiting
+        print(f"Dropping email retry to {to_email}: worker is shutting down")
 
+def send_email_task(subject, body, to_email, attempt=1):
+    """
+    Sends an email from the background executor, retrying failures that may be temporary.
+    Retries are scheduled on a timer rather than slept out, so no email thread sits idle
+    waiting and a sleeping retry never holds up worker shutdown.
+    """
     try:
-        msg = MIMEMultipart()
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls() # Upgrade the connection to a secure encrypted SSL/TLS connection
-            # For Resend, use the sender email as the username and the API Key as the password
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.send_message(msg) # Send the email
+        deliver_email(subject, body, to_email)
         print(f"Email sent successfully to {to_email}")
         return True
     except Exception as e:
+        if is_permanent_email_error(e):
+            print(f"Failed to send email to {to_email}, not retrying: {e}")
+            return False
         print(f"Failed to send email: {e}")
-        print(f"Error details: {e.args}") # Print error arguments for more details
-        return False
 
-def save_submission(submission_record):
-    """Appends form submission data to a JSON file."""
-    try:
-        if not os.path.exists(SUBMISSIONS_FILE):
-            with open(SUBMISSIONS_FILE, 'w') as f:
-                json.dump([], f) # Initialize with an empty list
-
-        with open(SUBMISSIONS_FILE, 'r+') as f:
-            file_data = json.load(f)
-            file_data.append(submission_record)
-            f.seek(0) # Rewind to the beginning of the file
-            json.dump(file_data, f, indent=4)
-            f.truncate() # Ensure old content is removed if new content is smaller
-        print("Submission saved to file.")
-        return True
-    except Exception as e:
-        print(f"Failed to save submission: {e}")
+    if attempt > EMAIL_MAX_RETRIES:
+        print(f"Giving up on email to {to_email} after {attempt} attempts")
         return False
-
+    print(f"Retrying email to {to_email} in {EMAIL_RETRY_DELAY}s (attempt {attempt + 1} of {EMAIL_MAX_RETRIES + 1})")
+    timer = threading.Timer(EMAIL_RETRY_DELAY, _retry_email, args=(subject, body, to_email, attempt + 1))
+    timer.daemon = True # Pending retries must not keep the worker alive
+    timer.start()
+    return False
 
 @app.route('/submit-report', methods=['POST'])
 def submit_report():
     """
     Receives form data (including potential file upload),
-    uploads image to Cloudinary, saves data, and sends email notification.
+    uploads image to Cloudinary, saves data, and queues an email notification.
     """
     # When frontend sends FormData, text fields are in request.form
     # and files are in request.files.
@@ -104,28 +157,30 @@ def submit_report():
     if not json_data_str:
         return jsonify({"message": "No JSON data found in request.form"}), 400
 
+    # Decode and validate in one pass; missing fields get the defaults from PestReport
     try:
-        data = json.loads(json_data_str)
-    except json.JSONDecodeError:
+        report = msgspec.json.decode(json_data_str, type=PestReport)
+    except msgspec.ValidationError as e:
+        return jsonify({"message": f"Invalid report data: {e}"}), 400
+    except msgspec.DecodeError:
         return jsonify({"message": "Invalid JSON data provided"}), 400
 
-    # Extract data from the parsed JSON
-    your_name = data.get('yourName', 'N/A')
-    business_area = data.get('businessArea', 'N/A')
-    pests = data.get('pests', [])
-    other_pest = data.get('otherPest', '') # Keep as empty string if not provided
-    report_date = data.get('reportDate', 'N/A')
-    additional_notes = data.get('additionalNotes', 'N/A')
-
     # --- Handle Image Upload to Cloudinary ---
     image_file = request.files.get('imageFile') # 'imageFile' is the key from frontend FormData
     image_url = "No image uploaded" # Default value if no image or upload fails
 
     if image_file and image_file.filename:
         try:
-            # Upload the image to Cloudinary
+            # Upload the image to Cloudinary in chunks, reading the stream piece by piece
+            # so the whole photo is never held in memory at once.
             # 'folder' helps organize uploads in your Cloudinary account
-            upload_result = cloudinary.uploader.upload(image_file, folder="pest_reports")
+            uploader = get_cloudinary_uploader()
+            upload_result = uploader.upload_large(
+                image_file.stream,
+                folder="pest_reports",
+                resource_type="image", # upload_large defaults to "raw"
+                chunk_size=CLOUDINARY_CHUNK_SIZE
+            )
             image_url = upload_result.get('secure_url') # Get the secure HTTPS URL of the uploaded image
             print(f"Image uploaded to Cloudinary: {image_url}")
         except Exception as e:
@@ -135,14 +190,16 @@ def submit_report():
         print("No image file provided in submission.")
 
     # Prepare the complete submission record (including image_url)
+    now = datetime.now()
     submission_record = {
-        "timestamp": datetime.now().isoformat(),
-        "yourName": your_name,
-        "businessArea": business_area,
-        "pests": pests,
-        "otherPest": other_pest,
-        "reportDate": report_date,
-        "additionalNotes": additional_notes,
+        "timestamp": now.isoformat(),
+        "ts_epoch": int(now.timestamp()), # Parsed once here so reports can filter with an integer compare
+        "yourName": report.yourName,
+        "businessArea": report.businessArea,
+        "pests": report.pests,
+        "otherPest": report.otherPest,
+        "reportDate": report.reportDate,
+        "additionalNotes": report.additionalNotes,
         "image_url": image_url # Store the Cloudinary URL
     }
 
@@ -151,23 +208,27 @@ def submit_report():
         return jsonify({"message": "Error saving submission"}), 500
 
     # --- Send immediate email notification ---
-    subject = f"New Pest Report from {your_name}"
-    body = (
-        f"A new pest report has been submitted:\n\n"
-        f"Name: {your_name}\n"
-        f"Business Area: {business_area}\n"
-        f"Pest(s): {', '.join(pests)}\n"
-        + (f"Other Pest: {other_pest}\n" if other_pest else "") + # Only include if other_pest has a value
-        f"Date: {report_date}\n"
-        f"Notes: {additional_notes}\n"
-        f"Image URL: {image_url}\n" # Include the image URL in the email
-        f"Submitted At: {submission_record['timestamp']}"
-    )
-
-    if send_email(subject, body, RECEIVER_EMAIL):
-        return jsonify({"message": "Report submitted and email sent successfully!"}), 200
-    else:
-        return jsonify({"message": "Report submitted, but email failed to send. Check backend logs."}), 500
+    subject = f"New Pest Report from {report.yourName}"
+    body = NOTIFICATION_BODY_FMT.format_map({
+        **submission_record,
+        "pests_joined": ', '.join(report.pests),
+        # Only include the Other Pest line if otherPest has a value
+        "other_line": f"Other Pest: {report.otherPest}\n" if report.otherPest else ""
+    })
+
+    # Without these settings every attempt would fail, so don't tie up an email thread retrying
+    if not email_configured():
+        print("Email settings (SENDER_EMAIL, SENDER_PASSWORD, RECEIVER_EMAIL) not set. Cannot send email.")
+        return jsonify({"message": "Report submitted, but email is not configured. Check backend logs."}), 500
+
+    # Queue the email and respond right away; delivery failures are logged by the task
+    _email_executor.submit(send_email_task, subject, body, RECEIVER_EMAIL)
+    return jsonify({"message": "Report submitted! Email notification is on its way."}), 202
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """Returns a JSON error when a request body exceeds MAX_CONTENT_LENGTH."""
+    return jsonify({"message": f"Upload too large. Maximum size is {MAX_UPLOAD_SIZE // (1024 * 1024)} MB."}), 413
 
 @app.route('/')
 def home():
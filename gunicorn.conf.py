@@ -0,0 +1,11 @@
+# gunicorn.conf.py
+# Gunicorn loads this file automatically when started from the project directory.
+
+def worker_exit(server, worker):
+    """
+    Saves buffered submissions as soon as a worker stops serving requests.
+    This runs before Python's own shutdown, which first waits for the email threads
+    and only then runs atexit handlers, too late if the worker is killed meanwhile.
+    """
+    from storage import flush_submissions
+    flush_submissions()
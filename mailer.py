@@ -0,0 +1,129 @@
+# mailer.py
+import os
+import queue
+from email.mime.text import MIMEText
+from dotenv import load_dotenv
+
+# Load environment variables from .env file (for local testing)
+# On Render, these will be set directly in Render's dashboard.
+load_dotenv()
+
+# --- Email Configuration (using Resend via SMTP) ---
+SENDER_EMAIL = os.getenv('SENDER_EMAIL')
+SENDER_PASSWORD = os.getenv('SENDER_PASSWORD') # This is your Resend API Key
+RECEIVER_EMAIL = os.getenv('RECEIVER_EMAIL') # Where notifications and weekly reports are sent
+# Set default SMTP_SERVER to Resend's server for robustness
+SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.resend.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', 587)) # Standard TLS port
+SMTP_POOL_SIZE = 5 # Maximum number of SMTP connections kept open per worker
+SMTP_MAX_MESSAGES = 100 # Reconnect after this many messages to stay under server session limits
+
+# Pool of (connection, messages_sent) pairs. Slots start empty and are connected on first use,
+# so the TLS handshake and login happen once per connection instead of once per email.
+# Last-in-first-out, so the most recently used connection is reused before idle or empty slots.
+_smtp_pool = queue.LifoQueue(maxsize=SMTP_POOL_SIZE)
+for _ in range(SMTP_POOL_SIZE):
+    _smtp_pool.put((None, 0))
+
+def _close_smtp(server):
+    """Closes an SMTP connection, ignoring errors from an already-dead connection."""
+    try:
+        server.quit()
+    except Exception:
+        server.close()
+
+def get_smtp():
+    """
+    Takes a logged-in SMTP connection from the pool, opening a new one if the slot is empty,
+    the connection no longer answers NOOP, or it has sent SMTP_MAX_MESSAGES messages.
+    Blocks while all pooled connections are in use. Hand it back with release_smtp().
+    """
+    import smtplib # Imported on first send to keep startup light
+
+    server, sent = _smtp_pool.get()
+    try:
+        if server is not None and sent >= SMTP_MAX_MESSAGES:
+            _close_smtp(server)
+            server = None
+        if server is not None:
+            try:
+                if server.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected("NOOP check failed")
+            except (smtplib.SMTPException, OSError):
+                _close_smtp(server)
+                server = None
+        if server is None:
+            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
+            server.starttls() # Upgrade the connection to a secure encrypted SSL/TLS connection
+            # For Resend, use the sender email as the username and the API Key as the password
+            server.login(SENDER_EMAIL, SENDER_PASSWORD)
+            sent = 0
+    except Exception:
+        if server is not None:
+            _close_smtp(server) # Don't leak a connection that failed STARTTLS or login
+        _smtp_pool.put((None, 0)) # Free the slot so other senders can retry
+        raise
+    return server, sent
+
+def release_smtp(server, sent):
+    """Returns a connection taken with get_smtp() to the pool."""
+    _smtp_pool.put((server, sent))
+
+def email_configured():
+    """Returns True if the sender credentials and receiver address needed to send email are set."""
+    return bool(SENDER_EMAIL and SENDER_PASSWORD and RECEIVER_EMAIL)
+
+def is_permanent_email_error(e):
+    """
+    Returns True for send errors that retrying won't fix: 5xx replies from the server, such as
+    rejected credentials or an unverified sender, and recipients that were all rejected with 5xx.
+    Anything else (dropped connections, timeouts, 4xx temporary errors) is worth retrying.
+    """
+    import smtplib
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code >= 500
+    return False
+
+def deliver_email(subject, body, to_email):
+    """
+    Sends an email over a pooled SMTP connection, raising the underlying error on failure.
+    Callers must check email_configured() first.
+    """
+    # The body is plain text only, so a single-part message is enough
+    msg = MIMEText(body, 'plain')
+    msg['From'] = SENDER_EMAIL
+    msg['To'] = to_email
+    msg['Subject'] = subject
+
+    server, sent = get_smtp()
+    try:
+        server.send_message(msg) # Send the email
+        sent += 1
+    except Exception:
+        # Don't hand a broken connection back to the pool
+        _close_smtp(server)
+        server, sent = None, 0
+        raise
+    finally:
+        release_smtp(server, sent)
+
+def send_email(subject, body, to_email):
+    """
+    Sends an email using SMTP.
+    Uses a pooled connection to the email server so repeated sends skip the handshake.
+    Configured for Resend (using SENDER_EMAIL as username and API Key as password).
+    """
+    if not email_configured():
+        print("Email settings (SENDER_EMAIL, SENDER_PASSWORD, RECEIVER_EMAIL) not set. Cannot send email.")
+        return False
+
+    try:
+        deliver_email(subject, body, to_email)
+        print(f"Email sent successfully to {to_email}")
+        return True
+    except Exception as e:
+        print(f"Failed to send email: {e}")
+        print(f"Error details: {e.args}") # Print error arguments for more details
+        return False
@@ -1,105 +1,60 @@
 # report_generator.py
-import json
+import io
+import orjson
 import os
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
 
-load_dotenv()
-
-# --- Email Configuration (using Resend via SMTP) ---
-SENDER_EMAIL = os.getenv('SENDER_EMAIL')
-SENDER_PASSWORD = os.getenv('SENDER_PASSWORD') # This is your Resend API Key
-RECEIVER_EMAIL = os.getenv('RECEIVER_EMAIL') # The email to send the report TO
-# Set default SMTP_SERVER to Resend's server for robustness
-SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.resend.com')
-SMTP_PORT = int(os.getenv('SMTP_PORT', 587)) # Standard TLS port
-
-SUBMISSIONS_FILE = 'data/submissions.json'
-
-def send_email(subject, body, to_email):
-    """
-    Sends an email using SMTP.
-    Configured for Resend (using SENDER_EMAIL as username and API Key as password).
-    """
-    if not SENDER_EMAIL or not SENDER_PASSWORD:
-        print("Email sender credentials not set. Cannot send report email.")
-        return False
-
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
-
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            # For Resend, use the sender email as the username and the API Key as the password
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.send_message(msg)
-        print(f"Report email sent successfully to {to_email}")
-        return True
-    except Exception as e:
-        print(f"Failed to send report email: {e}")
-        print(f"Error details: {e.args}") # Print error arguments for more details
-        return False
+from mailer import send_email, RECEIVER_EMAIL
+from storage import SUBMISSIONS_DB, load_recent_submissions, purge_older_than
 
 def generate_weekly_report():
     """Generates a text-based report from submissions recorded in the last 7 days."""
-    if not os.path.exists(SUBMISSIONS_FILE):
-        print("No submissions file found. No report generated.")
+    if not os.path.exists(SUBMISSIONS_DB):
+        print("No submissions database found. No report generated.")
         return "No submissions data available for the weekly report."
 
+    # Calculate the timestamp for 7 days ago
+    seven_days_ago = datetime.now() - timedelta(days=7)
+
+    # Build the report content one submission at a time, straight from the database cursor
+    buf = io.StringIO()
+    buf.write(
+        f"Weekly Pest Report - Last 7 Days ({seven_days_ago.strftime('%Y-%m-%d')} to {datetime.now().strftime('%Y-%m-%d')})\n\n"
+        + "="*60 + "\n\n" # A separator line
+    )
+    report_count = 0
     try:
-        with open(SUBMISSIONS_FILE, 'r') as f:
-            submissions = json.load(f) # Load all recorded submissions
-    except json.JSONDecodeError:
-        print("Error decoding JSON from submissions file. It might be empty or corrupted.")
+        for sub in load_recent_submissions(days=7):
+            g = sub.get
+            other = g('otherPest')
+            # Only include 'otherPest' if it has a non-empty value
+            other_line = f"  Other Pest: {other}\n" if other and other.strip() else ''
+            submitted_on = datetime.fromtimestamp(sub['ts_epoch']).strftime('%Y-%m-%d %H:%M:%S')
+            report_count += 1
+            if report_count > 1:
+                buf.write("\n") # Blank line between reports
+            buf.write(
+                f"--- Report #{report_count} ---\n"
+                f"  Name: {g('yourName', 'N/A')}\n"
+                f"  Business Area: {g('businessArea', 'N/A')}\n"
+                f"  Pest(s): {', '.join(g('pests', []))}\n"
+                f"{other_line}"
+                f"  Date of Incident: {g('reportDate', 'N/A')}\n"
+                f"  Notes: {g('additionalNotes', 'N/A')}\n"
+                f"  Image URL: {g('image_url', 'No image uploaded')}\n"
+                f"  Submitted On: {submitted_on}\n"
+            )
+    except orjson.JSONDecodeError:
+        print("Error decoding JSON from submissions database. A record might be corrupted.")
         return "Error reading submissions data. Report cannot be generated."
     except Exception as e:
         print(f"An unexpected error occurred while reading submissions: {e}")
         return "An error occurred while preparing the report."
 
-    # Calculate the timestamp for 7 days ago
-    seven_days_ago = datetime.now() - timedelta(days=7)
-    recent_submissions = []
-
-    # Filter submissions that occurred within the last 7 days
-    for s in submissions:
-        if 'timestamp' in s:
-            try:
-                submission_time = datetime.fromisoformat(s['timestamp'])
-                if submission_time >= seven_days_ago:
-                    recent_submissions.append(s)
-            except ValueError:
-                print(f"Warning: Invalid timestamp format found: {s['timestamp']}")
-                continue
-
-    if not recent_submissions:
+    if not report_count:
         return "No new pest reports in the last week."
 
-    # Build the report content
-    report_lines = [
-        f"Weekly Pest Report - Last 7 Days ({seven_days_ago.strftime('%Y-%m-%d')} to {datetime.now().strftime('%Y-%m-%d')})\n",
-        "="*60 + "\n" # A separator line
-    ]
-
-    for i, sub in enumerate(recent_submissions):
-        report_lines.append(f"--- Report #{i+1} ---")
-        report_lines.append(f"  Name: {sub.get('yourName', 'N/A')}")
-        report_lines.append(f"  Business Area: {sub.get('businessArea', 'N/A')}")
-        report_lines.append(f"  Pest(s): {', '.join(sub.get('pests', []))}")
-        if sub.get('otherPest') and sub.get('otherPest').strip() != '': # Only include if 'otherPest' has a non-empty value
-            report_lines.append(f"  Other Pest: {sub.get('otherPest')}")
-        report_lines.append(f"  Date of Incident: {sub.get('reportDate', 'N/A')}")
-        report_lines.append(f"  Notes: {sub.get('additionalNotes', 'N/A')}")
-        report_lines.append(f"  Image URL: {sub.get('image_url', 'No image uploaded')}") # Include image URL
-        report_lines.append(f"  Submitted On: {datetime.fromisoformat(sub['timestamp']).strftime('%Y-%m-%d %H:%M:%S')}\n")
-
-    return "\n".join(report_lines)
+    return buf.getvalue()
 
 if __name__ == '__main__':
     print("Starting weekly pest report generation process...")
@@ -111,23 +66,13 @@ if __name__ == '__main__':
     else:
         print("Failed to send weekly report. Check logs for details.")
 
-    # Optional: Clear old data after reporting to prevent the file from growing indefinitely.
+    # Optional: Clear old data after reporting to prevent the database from growing indefinitely.
     try:
-        if os.path.exists(SUBMISSIONS_FILE):
-            with open(SUBMISSIONS_FILE, 'r') as f:
-                all_submissions = json.load(f)
-
+        if os.path.exists(SUBMISSIONS_DB):
             # Keep only submissions newer than 7 days ago
-            seven_days_ago_for_clearing = datetime.now() - timedelta(days=7)
-            submissions_to_keep = [
-                s for s in all_submissions
-                if 'timestamp' in s and datetime.fromisoformat(s['timestamp']) >= seven_days_ago_for_clearing
-            ]
-
-            with open(SUBMISSIONS_FILE, 'w') as f:
-                json.dump(submissions_to_keep, f, indent=4)
-            print("Submissions file updated (old entries cleared).")
+            purge_older_than(days=7)
+            print("Submissions database updated (old entries cleared).")
         else:
-            print("Submissions file not found during clearing process.")
+            print("Submissions database not found during clearing process.")
     except Exception as e:
-        print(f"Failed to clear old submissions from file: {e}")
+        print(f"Failed to clear old submissions from database: {e}")
@@ -0,0 +1,223 @@
+# storage.py
+import os
+import atexit
+import collections
+import orjson
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Path to the SQLite database holding submission data
+SUBMISSIONS_DB = 'data/submissions.db'
+# JSON file used before the move to SQLite; imported once by init_db()
+LEGACY_SUBMISSIONS_FILE = 'data/submissions.json'
+SUBMISSION_FLUSH_INTERVAL = 1 # Seconds between writes of buffered submissions to the database
+SUBMISSION_FLUSH_MAX_BACKOFF = 60 # Longest wait between retries while the database can't be written
+MAX_PENDING_SUBMISSIONS = 10_000 # Buffered submissions allowed before new ones are refused
+
+# Each worker thread keeps its own SQLite connection
+_db_local = threading.local()
+
+def connect_db():
+    """
+    Opens a new connection to the submissions database.
+    WAL mode lets the weekly report read while new submissions are being written.
+    """
+    conn = sqlite3.connect(SUBMISSIONS_DB, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+def get_db():
+    """Returns the current thread's database connection, opening it on first use."""
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        conn = connect_db()
+        _db_local.conn = conn
+    return conn
+
+def init_db():
+    """Creates the submissions table and its timestamp index if they don't exist yet."""
+    # Ensure the 'data' directory exists
+    os.makedirs(os.path.dirname(SUBMISSIONS_DB), exist_ok=True)
+
+    # Use a short-lived connection so no connection is shared with forked Gunicorn workers
+    conn = connect_db()
+    try:
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS submissions("
+                "id INTEGER PRIMARY KEY, ts TEXT NOT NULL, ts_epoch INTEGER NOT NULL, payload TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ts_epoch ON submissions(ts_epoch)")
+        import_legacy_submissions(conn)
+    finally:
+        conn.close()
+
+def import_legacy_submissions(conn):
+    """
+    One-time import of the JSON file used before submissions moved to SQLite.
+    Runs only while the table is still empty, then renames the file so it is never read again.
+    """
+    # Take the write lock first so parallel Gunicorn workers can't both import the file
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        has_rows = conn.execute("SELECT 1 FROM submissions LIMIT 1").fetchone()
+        if has_rows or not os.path.exists(LEGACY_SUBMISSIONS_FILE):
+            conn.rollback()
+            return
+
+        with open(LEGACY_SUBMISSIONS_FILE, 'rb') as f:
+            legacy_submissions = orjson.loads(f.read())
+
+        rows = []
+        for s in legacy_submissions:
+            try:
+                ts_epoch = int(datetime.fromisoformat(s['timestamp']).timestamp())
+            except (KeyError, TypeError, ValueError):
+                timestamp = s.get('timestamp') if isinstance(s, dict) else s
+                print(f"Warning: Skipping legacy submission without a valid timestamp: {timestamp}")
+                continue
+            rows.append((s['timestamp'], ts_epoch, orjson.dumps(s).decode()))
+        conn.executemany("INSERT INTO submissions(ts, ts_epoch, payload) VALUES (?, ?, ?)", rows)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Failed to import legacy submissions from {LEGACY_SUBMISSIONS_FILE}: {e}")
+        return
+    print(f"Imported {len(rows)} submission(s) from {LEGACY_SUBMISSIONS_FILE}.")
+
+    # Only renamed once the rows are committed, so a failed import is retried on the next start.
+    # Workers that were waiting on the lock now see a non-empty table and skip the file.
+    try:
+        os.replace(LEGACY_SUBMISSIONS_FILE, LEGACY_SUBMISSIONS_FILE + '.imported')
+    except OSError as e:
+        print(f"Failed to rename {LEGACY_SUBMISSIONS_FILE} after import: {e}")
+
+# Write-behind buffer: requests only queue their submission, and a background thread
+# saves everything pending in one transaction every SUBMISSION_FLUSH_INTERVAL seconds.
+# A hard crash can lose up to one interval of submissions; the emails still go out.
+_pending_submissions = collections.deque()
+_flush_lock = threading.Lock()
+_flusher_lock = threading.Lock()
+_flusher_started = False
+
+def flush_submissions():
+    """
+    Saves all buffered submissions to the database in a single transaction.
+    Returns False if the write failed and the submissions were put back in the buffer.
+    """
+    with _flush_lock:
+        batch = []
+        while _pending_submissions:
+            batch.append(_pending_submissions.popleft())
+        if not batch:
+            return True
+
+        try:
+            conn = get_db()
+            with conn: # Commits the batch, or rolls it back on error
+                conn.executemany(
+                    "INSERT INTO submissions(ts, ts_epoch, payload) VALUES (?, ?, ?)",
+                    [
+                        (
+                            record['timestamp'],
+                            record['ts_epoch'],
+                            orjson.dumps(record).decode() # Compact output, no indentation
+                        )
+                        for record in batch
+                    ]
+                )
+            print(f"{len(batch)} submission(s) saved to database.")
+            return True
+        except Exception as e:
+            # The transaction was rolled back, so nothing was written. Put the batch back at
+            # the front of the buffer, in order, so the next flush retries it instead of losing it.
+            _pending_submissions.extendleft(reversed(batch))
+            print(f"Failed to save {len(batch)} submission(s), {len(_pending_submissions)} waiting: {e}")
+            return False
+
+def _flush_loop():
+    """
+    Runs in the background, flushing buffered submissions periodically.
+    While writes keep failing, the wait between attempts doubles up to SUBMISSION_FLUSH_MAX_BACKOFF.
+    """
+    delay = SUBMISSION_FLUSH_INTERVAL
+    while True:
+        time.sleep(delay)
+        if flush_submissions():
+            delay = SUBMISSION_FLUSH_INTERVAL
+        else:
+            delay = min(delay * 2, SUBMISSION_FLUSH_MAX_BACKOFF)
+            print(f"Retrying database write in {delay}s.")
+
+def _start_flusher():
+    """
+    Starts the background flush thread on first use.
+    Started lazily rather than at import so each forked Gunicorn worker gets its own thread.
+    """
+    global _flusher_started
+    with _flusher_lock:
+        if not _flusher_started:
+            threading.Thread(target=_flush_loop, name='submission-flusher', daemon=True).start()
+            _flusher_started = True
+
+# Under Gunicorn the worker_exit hook (gunicorn.conf.py) flushes first; this catches
+# anything left when running without it, e.g. the Flask development server
+atexit.register(flush_submissions)
+
+def save_submission(submission_record):
+    """
+    Queues form submission data to be written to the database by the background flusher.
+    Returns False without queuing if the buffer is full because the database can't be written.
+    """
+    try:
+        _start_flusher()
+        if len(_pending_submissions) >= MAX_PENDING_SUBMISSIONS:
+            print(f"Submission buffer full ({len(_pending_submissions)} waiting). Rejecting submission.")
+            return False
+        _pending_submissions.append(submission_record)
+        return True
+    except Exception as e:
+        print(f"Failed to queue submission: {e}")
+        return False
+
+def load_recent_submissions(days=7):
+    """
+    Yields submissions recorded in the last `days` days, oldest first.
+    The ts_epoch index turns this into a range scan that starts at the cutoff and never
+    touches older rows, so the cost grows with the number of matches, not the table size.
+    Rows are decoded as they are read, so only one record is held in memory at a time.
+    """
+    since = int((datetime.now() - timedelta(days=days)).timestamp())
+    conn = connect_db()
+    try:
+        cursor = conn.execute(
+            "SELECT ts_epoch, payload FROM submissions WHERE ts_epoch >= ? ORDER BY ts_epoch",
+            (since,)
+        )
+        for ts_epoch, payload in cursor:
+            sub = orjson.loads(payload)
+            sub['ts_epoch'] = ts_epoch # Older payloads only carry the ISO timestamp
+            yield sub
+    finally:
+        conn.close()
+
+def purge_older_than(days=7):
+    """
+    Deletes submissions older than `days` days and returns how many were removed.
+    The database is then compacted so the file on disk only holds the remaining rows.
+    """
+    before = int((datetime.now() - timedelta(days=days)).timestamp())
+    conn = connect_db()
+    try:
+        with conn:
+            cursor = conn.execute("DELETE FROM submissions WHERE ts_epoch < ?", (before,))
+        if cursor.rowcount:
+            # Deleted rows only leave free pages behind; VACUUM rewrites the file without them
+            conn.execute("VACUUM")
+        return cursor.rowcount
+    finally:
+        conn.close()